@@ -5,6 +5,7 @@ from pathlib import Path
 src_path = Path(__file__).parent.parent / "src"
 sys.path.append(str(src_path))
 
+import asyncio
 import logging
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
@@ -45,7 +46,7 @@ class PIIConfig(BaseModel):
     )
 
 
-def main():
+async def main():
     # Sample input text
     input_texts = [
         "John Doe's email is john.doe@example.com. "
@@ -54,7 +55,9 @@ def main():
     ]
 
     # Extract PII from input text
-    extracted_pii = [extract_pii(text, PIIConfig) for text in input_texts]
+    extracted_pii = await asyncio.gather(
+        *(extract_pii(text, PIIConfig) for text in input_texts)
+    )
 
     # Mask PII in input text
     masked_text = [
@@ -66,4 +69,4 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
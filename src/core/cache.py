@@ -0,0 +1,104 @@
+from cachetools import LRUCache, TTLCache
+from typing import Any, Dict, List, Optional, Union
+from src.core.config import Settings
+import hashlib
+import logging
+import orjson
+import threading
+
+logger = logging.getLogger(__name__)
+
+ExtractedPII = List[Dict[str, Any]]
+
+
+def extraction_cache_key(text: str, pii_types: List[str], model_name: str) -> str:
+    """
+    Build the cache key of an extraction result.
+
+    Args:
+        text: Input text the PII was extracted from
+        pii_types: PII types the text was searched for
+        model_name: Name of the model that extracted the PII
+
+    Returns:
+        Hex digest identifying the model, PII types and text
+    """
+    payload = f"{model_name}|{','.join(sorted(pii_types))}|{text}"
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class LocalExtractionCache:
+    """In-process LRU cache of extraction results, safe to share between threads."""
+
+    def __init__(self, maxsize: int, ttl: int = 0):
+        self._cache: Union[LRUCache, TTLCache] = (
+            TTLCache(maxsize=maxsize, ttl=ttl) if ttl > 0 else LRUCache(maxsize=maxsize)
+        )
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[ExtractedPII]:
+        with self._lock:
+            cached = self._cache.get(key)
+        # Hand out a copy so callers cannot change the cached list
+        return None if cached is None else list(cached)
+
+    async def set(self, key: str, extracted_pii: ExtractedPII) -> None:
+        with self._lock:
+            self._cache[key] = list(extracted_pii)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+class RedisExtractionCache:
+    """Extraction results stored in Redis, shared by all server processes."""
+
+    def __init__(self, url: str, ttl: int = 0):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise ImportError(
+                "The redis cache backend requires the 'redis' package"
+            ) from e
+
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl or None
+
+    async def get(self, key: str) -> Optional[ExtractedPII]:
+        cached = await self._redis.get(key)
+        return None if cached is None else orjson.loads(cached)
+
+    async def set(self, key: str, extracted_pii: ExtractedPII) -> None:
+        await self._redis.set(key, orjson.dumps(extracted_pii), ex=self._ttl)
+
+
+ExtractionCache = Union[LocalExtractionCache, RedisExtractionCache]
+
+
+def create_extraction_cache(settings: Settings) -> Optional[ExtractionCache]:
+    """
+    Create the extraction cache selected by the settings.
+
+    Args:
+        settings: Application settings
+
+    Returns:
+        The configured cache, or None if caching is disabled
+
+    Raises:
+        ValueError: If the cache backend is unknown
+    """
+    if settings.cache_backend == "redis":
+        logger.info("Caching extraction results in redis")
+        return RedisExtractionCache(settings.redis_url, settings.extraction_cache_ttl)
+
+    if settings.cache_backend != "local":
+        raise ValueError(f"Unknown cache backend: {settings.cache_backend}")
+
+    if settings.extraction_cache_size <= 0:
+        return None
+
+    return LocalExtractionCache(
+        settings.extraction_cache_size, settings.extraction_cache_ttl
+    )
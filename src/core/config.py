@@ -8,6 +8,41 @@ class Settings(BaseSettings):
     openai_api_key: str = "placeholder"
     openai_model_name: str = "placeholder"
 
+    # Upper bound on concurrent LLM calls issued across all requests
+    max_concurrent_llm: int = 16
+
+    # Connection pool limits of the shared HTTP client used for LLM calls
+    http_max_connections: int = 256
+    http_max_keepalive_connections: int = 64
+
+    # Skip LLM calls for texts without a digit run matching any configured PII
+    # type, and only ask for the types a text may contain. Off by default because
+    # numbers spelled out in words do not match and would go unmasked
+    enable_prefilter: bool = False
+
+    # Texts packed into a single LLM call by /mask-pii (1 disables packing)
+    pack_size: int = 1
+
+    # Extraction cache backend: "local" (in-process LRU) or "redis"
+    cache_backend: str = "local"
+    redis_url: str = "redis://localhost:6379/0"
+
+    # Number of extraction results kept in the in-process cache (0 disables it)
+    extraction_cache_size: int = 4096
+
+    # Seconds an extraction result stays cached (0 keeps it until evicted)
+    extraction_cache_ttl: int = 0
+
+    # Texts at least this long stream the LLM response (0 disables streaming)
+    stream_min_chars: int = 0
+
+    # Requests with more texts than this use the OpenAI Batch API (0 disables it)
+    batch_api_threshold: int = 0
+    batch_api_poll_interval: float = 10.0
+
+    # Seconds to wait for a batch job before cancelling it
+    batch_api_max_wait: float = 3600.0
+
     host: str = "0.0.0.0"
     port: int = 8081
 
@@ -1,5 +1,8 @@
-from pydantic import BaseModel, Field, create_model
-from typing import List, Dict
+import msgspec
+
+from functools import lru_cache
+from pydantic import BaseModel, ConfigDict, Field, create_model
+from typing import List, Dict, Optional, Tuple, Union
 
 
 class PIITypeConfig(BaseModel):
@@ -24,10 +27,11 @@ class MaskResponse(BaseModel):
     masked_texts: List[str] = Field(
         ..., title="Masked Texts", description="List of texts with PII masked"
     )
-    detected_pii: List[List[Dict[str, str]]] = Field(
+    detected_pii: List[List[Dict[str, Union[str, int]]]] = Field(
         ...,
         title="Detected PII",
-        description="List of PII detected in each text. Each inner list contains dictionaries of PII found in the corresponding text.",
+        description="List of PII detected in each text. Each inner list contains dictionaries of PII found in the corresponding text, "
+        "with the character offsets of the PII in that text under 'start' and 'end'.",
     )
 
 
@@ -43,31 +47,115 @@ class MaskRequest(BaseModel):
             "John Doe's other email is johns.other.mail@example.com",
         ],
     )
+    pii_config: Optional[Dict[str, PIITypeConfig]] = Field(
+        None,
+        title="PII Configuration",
+        description="Dictionary mapping PII types to their mask configurations. "
+        "Required unless config_id is given.",
+        example={
+            "first_name": {"mask": "[!FIRST-NAME!]"},
+            "last_name": {"mask": "[!LAST-NAME!]"},
+            "email": {"mask": "[!EMAIL-ADDRESS!]"},
+        },
+    )
+    config_id: Optional[str] = Field(
+        None,
+        title="Configuration ID",
+        description="ID of a PII configuration registered via /configs. "
+        "Takes precedence over pii_config.",
+    )
+
+
+class PIITypeConfigFast(msgspec.Struct):
+    """msgspec counterpart of PIITypeConfig for decoding hot-path requests."""
+
+    mask: str
+
+
+class MaskRequestFast(msgspec.Struct):
+    """
+    msgspec counterpart of MaskRequest.
+
+    Decodes and validates raw request bodies without pydantic, which matters for
+    requests with many texts. MaskRequest stays the documented request schema.
+    """
+
+    texts: List[str]
+    pii_config: Optional[Dict[str, PIITypeConfigFast]] = None
+    config_id: Optional[str] = None
+
+
+class ConfigRequest(BaseModel):
+    """API request model for registering a PII configuration."""
+
     pii_config: Dict[str, PIITypeConfig] = Field(
         ...,
         title="PII Configuration",
         description="Dictionary mapping PII types to their mask configurations",
         example={
             "first_name": {"mask": "[!FIRST-NAME!]"},
-            "last_name": {"mask": "[!LAST-NAME!]"},
             "email": {"mask": "[!EMAIL-ADDRESS!]"},
         },
     )
 
 
+class ConfigResponse(BaseModel):
+    """API response model for a registered PII configuration."""
+
+    config_id: str = Field(
+        ...,
+        title="Configuration ID",
+        description="ID to pass as config_id to the masking endpoints",
+    )
+
+
+class _PIIBase(BaseModel):
+    """Shared base class of the dynamically created PII configuration models."""
+
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
+
 def create_dynamic_pii_config(pii_config_dict: Dict[str, PIITypeConfig]) -> type:
     """
     Dynamically create a PIIConfig class from the request configuration.
 
+    Classes are cached on the (PII type, mask) pairs of the configuration, so
+    repeated requests with the same configuration reuse the same class.
+
     Args:
         pii_config_dict: Dictionary of PII types and their configurations
 
     Returns:
         Dynamically created PIIConfig class
+
+    Raises:
+        ValueError: If a PII type name cannot be used as a model field name
+    """
+    key = tuple(
+        sorted((pii_type, config.mask) for pii_type, config in pii_config_dict.items())
+    )
+    return _create_dynamic_pii_config(key)
+
+
+def _check_pii_type_name(pii_type: str) -> None:
     """
+    Reject PII type names that pydantic cannot turn into fields of _PIIBase.
+    """
+    if not pii_type.isidentifier():
+        raise ValueError(f"PII type '{pii_type}' must be a valid identifier")
+    if pii_type.startswith("_"):
+        raise ValueError(f"PII type '{pii_type}' must not start with an underscore")
+    if pii_type.startswith("model_") or hasattr(_PIIBase, pii_type):
+        raise ValueError(f"PII type '{pii_type}' is a reserved name")
+
+
+@lru_cache(maxsize=256)
+def _create_dynamic_pii_config(key: Tuple[Tuple[str, str], ...]) -> type:
+    for pii_type, _ in key:
+        _check_pii_type_name(pii_type)
+
     fields = {
-        pii_type: (str, Field(..., json_schema_extra={"mask": config.mask}))
-        for pii_type, config in pii_config_dict.items()
+        pii_type: (str, Field(..., json_schema_extra={"mask": mask}))
+        for pii_type, mask in key
     }
-
-    return create_model("DynamicPIIConfig", __base__=BaseModel, **fields)
+    return create_model("DynamicPIIConfig", __base__=_PIIBase, **fields)
@@ -1,9 +1,24 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, ValidationError
-from typing import Type
-from src.models import MaskResponse, MaskRequest, create_dynamic_pii_config
-from src.masking import extract_pii, mask_pii
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple, Type
+from src.core.config import Settings
+from src.models import (
+    ConfigRequest,
+    ConfigResponse,
+    MaskResponse,
+    MaskRequest,
+    MaskRequestFast,
+    create_dynamic_pii_config,
+)
+from src.masking import extract_pii, extract_pii_batch, extract_pii_packed, mask_pii
+from contextlib import asynccontextmanager
+import src.masking as masking
+import asyncio
 import logging
+import msgspec
+import orjson
+import uuid
 
 
 # Configure logging
@@ -12,76 +27,283 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Load settings
+settings = Settings()
+
+# PII configurations registered via /configs, by config ID
+registered_configs: Dict[str, Type[BaseModel]] = {}
+
+# Reusable msgspec decoder for mask request bodies
+mask_request_decoder = msgspec.json.Decoder(MaskRequestFast)
+
+# Semaphore bounding LLM calls across all requests, with its event loop and limit
+_SemaphoreSlot = Tuple[asyncio.AbstractEventLoop, int, asyncio.Semaphore]
+_llm_semaphore: Optional[_SemaphoreSlot] = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    """
+    Warm up the shared OpenAI client on startup and close it on shutdown.
+
+    A cheap models.list() call opens a keep-alive connection to the provider, so
+    the first masking request does not pay for the TCP and TLS handshakes. The
+    call gets a short timeout and no retries so a hanging provider cannot stall
+    startup.
+    """
+    try:
+        await masking.client.with_options(timeout=5, max_retries=0).models.list()
+        logger.info("Warmed up the OpenAI client connection pool")
+    except Exception as e:
+        # The API stays usable, the first request just opens its own connection
+        logger.warning(f"Failed to warm up the OpenAI client: {str(e)}")
+
+    yield
+
+    await masking.client.close()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="PII Masking API",
     description="API for masking Personal Identifiable Information in text with custom PII configurations",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
+def get_request_body_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Build an OpenAPI request body for endpoints that decode their body themselves.
+
+    Args:
+        model: Pydantic model documenting the request body
+
+    Returns:
+        OpenAPI requestBody object with the model's JSON schema inlined
+    """
+    schema = model.model_json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def inline(node: Any) -> Any:
+        if isinstance(node, dict):
+            ref = node.get("$ref", "")
+            if ref.startswith("#/$defs/"):
+                return inline(definitions[ref.removeprefix("#/$defs/")])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(value) for value in node]
+        return node
+
+    return {
+        "required": True,
+        "content": {"application/json": {"schema": inline(schema)}},
+    }
+
+
+async def decode_mask_request(request: Request) -> MaskRequestFast:
+    """
+    Decode and validate a mask request body with msgspec.
+
+    Args:
+        request: Incoming HTTP request
+
+    Returns:
+        Decoded MaskRequestFast object
+
+    Raises:
+        HTTPException: If the body is not valid JSON or does not match the schema
+    """
+    try:
+        return mask_request_decoder.decode(await request.body())
+
+    except msgspec.MsgspecError as e:
+        logger.error(f"Invalid request body: {str(e)}")
+        raise HTTPException(status_code=422, detail=f"Invalid request body: {str(e)}")
+
+
+def validate_mask_request(request: MaskRequestFast) -> None:
+    """
+    Validate the PII config and input texts of a mask request.
+
+    Args:
+        request: MaskRequestFast object to validate
+
+    Raises:
+        ValueError: If the config or any of the texts is empty
+    """
+    # Validate PII config
+    if request.config_id is None and not request.pii_config:
+        raise ValueError("PII configuration cannot be empty")
+
+    # Validate input texts
+    if not request.texts:
+        raise ValueError("Input texts cannot be empty")
+
+    # Single pass over the texts, stopping at the first invalid one. The decoder
+    # already guarantees every text is a string
+    for text in request.texts:
+        if not text or text.isspace():
+            raise ValueError("Input texts cannot be empty strings or whitespace only")
+
+
+def resolve_pii_config(request: MaskRequestFast) -> Type[BaseModel]:
+    """
+    Get the PII config class of a mask request.
+
+    Args:
+        request: Validated MaskRequestFast object
+
+    Returns:
+        The registered config class if config_id is given, otherwise the dynamic
+        config class built from pii_config
+
+    Raises:
+        ValueError: If config_id is not registered
+    """
+    if request.config_id is not None:
+        config = registered_configs.get(request.config_id)
+        if config is None:
+            raise ValueError(f"Unknown PII configuration ID: {request.config_id}")
+        return config
+
+    return create_dynamic_pii_config(request.pii_config)
+
+
+def get_llm_semaphore() -> asyncio.Semaphore:
+    """
+    Get the semaphore bounding concurrent LLM calls of the whole process.
+
+    Sharing one semaphore across requests keeps the total number of in-flight
+    calls within settings.max_concurrent_llm, so concurrent requests cannot
+    together exceed the provider's rate limits. It is recreated when the event
+    loop or the configured limit changes.
+
+    Returns:
+        Semaphore to hold while calling the LLM
+    """
+    global _llm_semaphore
+    loop = asyncio.get_running_loop()
+    limit = settings.max_concurrent_llm
+    if _llm_semaphore is None or _llm_semaphore[:2] != (loop, limit):
+        _llm_semaphore = (loop, limit, asyncio.Semaphore(limit))
+    return _llm_semaphore[2]
+
+
+def mask_texts(
+    texts: List[str],
+    all_detected_pii: List[List[Dict[str, str]]],
+    config: Type[BaseModel],
+) -> List[str]:
+    """
+    Mask the detected PII in each text.
+
+    Args:
+        texts: Input texts
+        all_detected_pii: Detected PII for each input text
+        config: PII configuration model class
+
+    Returns:
+        List of masked texts in input order
+    """
+    return [
+        mask_pii(text, extracted_pii, config)
+        for text, extracted_pii in zip(texts, all_detected_pii)
+    ]
+
+
 @app.post(
     "/mask-pii",
-    response_model=MaskResponse,
+    responses={200: {"model": MaskResponse}},
     summary="Mask PII in multiple texts",
     description="Analyzes multiple input texts and masks detected PII according to custom configuration",
+    openapi_extra={"requestBody": get_request_body_schema(MaskRequest)},
 )
-async def mask_pii_endpoint(request: MaskRequest):
+async def mask_pii_endpoint(http_request: Request):
     """
     Endpoint to mask PII in provided texts with custom configuration.
 
     Args:
-        request: MaskRequest object containing the list of input texts and PII config
+        http_request: Request whose JSON body matches MaskRequest, containing the list
+            of input texts and PII config
 
     Returns:
-        MaskResponse containing original texts, masked texts, and detected PII
+        JSON response in the MaskResponse shape containing original texts, masked texts,
+        and detected PII
 
     Raises:
         HTTPException: If processing fails or config is invalid
     """
+    # Decode outside the try block so body errors keep their 422 status
+    request = await decode_mask_request(http_request)
+
     try:
-        # Validate PII config
-        if not request.pii_config:
-            raise ValueError("PII configuration cannot be empty")
+        validate_mask_request(request)
 
-        # Validate input texts
-        if not request.texts:
-            raise ValueError("Input texts cannot be empty")
+        # Look up or create dynamic PII config class
+        DynamicPIIConfig: Type[BaseModel] = resolve_pii_config(request)
 
-        if not all(isinstance(text, str) for text in request.texts):
-            raise ValueError("All input texts must be strings")
+        # Identical texts share a single extraction
+        unique_texts = list(dict.fromkeys(request.texts))
 
-        if not all(text.strip() for text in request.texts):
-            raise ValueError("Input texts cannot be empty strings or whitespace only")
+        if 0 < settings.batch_api_threshold < len(unique_texts):
+            # Large payloads go through the cheaper OpenAI Batch API
+            unique_detected_pii = await extract_pii_batch(
+                unique_texts, DynamicPIIConfig
+            )
+        elif settings.pack_size > 1:
+            # Pack several texts into each LLM call, running the calls concurrently
+            semaphore = get_llm_semaphore()
 
-        # Create dynamic PII config class
-        DynamicPIIConfig: Type[BaseModel] = create_dynamic_pii_config(
-            request.pii_config
-        )
+            async def extract_pack_with_limit(
+                texts: List[str],
+            ) -> List[List[Dict[str, str]]]:
+                async with semaphore:
+                    return await extract_pii_packed(texts, DynamicPIIConfig)
+
+            packs = await asyncio.gather(
+                *(
+                    extract_pack_with_limit(unique_texts[i : i + settings.pack_size])
+                    for i in range(0, len(unique_texts), settings.pack_size)
+                )
+            )
+            unique_detected_pii = [pii for pack in packs for pii in pack]
+        else:
+            # Extract PII from all texts concurrently, bounded to avoid rate-limit storms
+            semaphore = get_llm_semaphore()
 
-        # Process each text
-        masked_texts = []
-        all_detected_pii = []
+            async def extract_with_limit(text: str) -> List[Dict[str, str]]:
+                async with semaphore:
+                    return await extract_pii(text, DynamicPIIConfig)
 
-        for text in request.texts:
-            # Extract PII using the dynamic config
-            extracted_pii = extract_pii(text, DynamicPIIConfig)
-            all_detected_pii.append(extracted_pii)
+            unique_detected_pii = await asyncio.gather(
+                *(extract_with_limit(text) for text in unique_texts)
+            )
 
-            # Mask the text
-            masked_text = mask_pii(text, extracted_pii, DynamicPIIConfig)
-            masked_texts.append(masked_text)
+        detected_by_text = dict(zip(unique_texts, unique_detected_pii))
+        all_detected_pii = [detected_by_text[text] for text in request.texts]
+
+        # Mask in a worker thread so the event loop keeps serving other requests
+        masked_texts = await asyncio.to_thread(
+            mask_texts, request.texts, all_detected_pii, DynamicPIIConfig
+        )
 
         # Log the operation
         logger.info(
-            f"Processed {len(request.texts)} texts with {len(request.pii_config)} PII types. "
+            f"Processed {len(request.texts)} texts with {len(DynamicPIIConfig.model_fields)} PII types. "
             f"Detected {sum(len(pii) for pii in all_detected_pii)} total PII items"
         )
 
-        return MaskResponse(
-            original_texts=request.texts,
-            masked_texts=masked_texts,
-            detected_pii=all_detected_pii,
+        # Serialize with orjson directly, skipping response model validation
+        return Response(
+            content=orjson.dumps(
+                {
+                    "original_texts": request.texts,
+                    "masked_texts": masked_texts,
+                    "detected_pii": all_detected_pii,
+                }
+            ),
+            media_type="application/json",
         )
 
     except ValidationError as e:
@@ -99,6 +321,141 @@ async def mask_pii_endpoint(request: MaskRequest):
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+@app.post(
+    "/mask-pii/stream",
+    summary="Mask PII in multiple texts and stream the results",
+    description="Analyzes multiple input texts and streams one NDJSON line per text as soon as it is masked. "
+    "Lines arrive in completion order and carry the index of their input text.",
+    openapi_extra={"requestBody": get_request_body_schema(MaskRequest)},
+)
+async def mask_pii_stream_endpoint(http_request: Request):
+    """
+    Endpoint to mask PII in provided texts, streaming each result as it completes.
+
+    Args:
+        http_request: Request whose JSON body matches MaskRequest, containing the list
+            of input texts and PII config
+
+    Returns:
+        StreamingResponse emitting one JSON object per line with the index, original
+        text, masked text and detected PII of a single input text. Texts that fail
+        to process yield a line with the index and an error message instead.
+
+    Raises:
+        HTTPException: If the config or input texts are invalid
+    """
+    # Decode outside the try block so body errors keep their 422 status
+    request = await decode_mask_request(http_request)
+
+    try:
+        validate_mask_request(request)
+
+        # Look up or create dynamic PII config class
+        DynamicPIIConfig: Type[BaseModel] = resolve_pii_config(request)
+
+    except ValidationError as e:
+        logger.error(f"Invalid PII configuration: {str(e)}")
+        raise HTTPException(
+            status_code=400, detail=f"Invalid PII configuration: {str(e)}"
+        )
+
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+    semaphore = get_llm_semaphore()
+
+    async def process_one(index: int, text: str) -> Dict[str, Any]:
+        try:
+            async with semaphore:
+                extracted_pii = await extract_pii(text, DynamicPIIConfig)
+
+            return {
+                "index": index,
+                "original_text": text,
+                "masked_text": await asyncio.to_thread(
+                    mask_pii, text, extracted_pii, DynamicPIIConfig
+                ),
+                "detected_pii": extracted_pii,
+            }
+
+        except Exception as e:
+            logger.error(f"Error processing text {index}: {str(e)}")
+            return {"index": index, "error": "Internal server error"}
+
+    async def generate() -> AsyncIterator[bytes]:
+        tasks = [
+            asyncio.create_task(process_one(index, text))
+            for index, text in enumerate(request.texts)
+        ]
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                yield orjson.dumps(await next_result) + b"\n"
+        finally:
+            # Stop outstanding LLM calls if the client disconnects early
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
+@app.post(
+    "/configs",
+    response_model=ConfigResponse,
+    summary="Register a PII configuration",
+    description="Registers a PII configuration once so masking requests can refer to it by config_id "
+    "instead of sending and rebuilding it every time",
+)
+async def register_config_endpoint(request: ConfigRequest):
+    """
+    Endpoint to register a PII configuration for reuse across masking requests.
+
+    The config ID is derived from the configured types and masks, so registering
+    the same configuration again returns the same ID.
+
+    Args:
+        request: ConfigRequest object containing the PII config
+
+    Returns:
+        ConfigResponse containing the config ID
+
+    Raises:
+        HTTPException: If the config is empty or invalid, or registration fails
+    """
+    try:
+        if not request.pii_config:
+            raise ValueError("PII configuration cannot be empty")
+
+        signature = sorted(
+            (pii_type, config.mask) for pii_type, config in request.pii_config.items()
+        )
+        config_id = str(
+            uuid.uuid5(uuid.NAMESPACE_OID, orjson.dumps(signature).decode())
+        )
+        registered_configs[config_id] = create_dynamic_pii_config(request.pii_config)
+
+        logger.info(f"Registered PII configuration {config_id}")
+        return ConfigResponse(config_id=config_id)
+
+    except ValidationError as e:
+        logger.error(f"Invalid PII configuration: {str(e)}")
+        raise HTTPException(
+            status_code=400, detail=f"Invalid PII configuration: {str(e)}"
+        )
+
+    except ValueError as e:
+        logger.error(f"Validation error: {str(e)}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    except Exception as e:
+        logger.error(f"Error registering configuration: {str(e)}")
+        raise HTTPException(status_code=500, detail="Internal server error")
+
+
 @app.get("/health", summary="Health check endpoint")
 async def health_check():
     """Simple health check endpoint."""
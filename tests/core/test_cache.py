@@ -0,0 +1,106 @@
+import asyncio
+import pytest
+import sys
+import types
+from src.core.cache import (
+    LocalExtractionCache,
+    RedisExtractionCache,
+    create_extraction_cache,
+    extraction_cache_key,
+)
+from src.core.config import Settings
+
+
+def test_extraction_cache_key_depends_on_model_types_and_text():
+    key = extraction_cache_key("Hi alice", ["email", "name"], "model-a")
+    assert key == extraction_cache_key("Hi alice", ["name", "email"], "model-a")
+    assert key != extraction_cache_key("Hi alice", ["email", "name"], "model-b")
+    assert key != extraction_cache_key("Hi alice", ["email"], "model-a")
+    assert key != extraction_cache_key("Hi bob", ["email", "name"], "model-a")
+
+
+def test_local_cache_evicts_least_recently_used_and_returns_copies():
+    cache = LocalExtractionCache(maxsize=2)
+
+    async def run():
+        await cache.set("a", [{"pii": "x", "type": "email"}])
+        await cache.set("b", [])
+        (await cache.get("a")).clear()
+        await cache.set("c", [])
+        return await cache.get("a"), await cache.get("b"), await cache.get("c")
+
+    a, b, c = asyncio.run(run())
+    assert a == [{"pii": "x", "type": "email"}]
+    assert b is None
+    assert c == []
+
+
+def test_create_extraction_cache_respects_settings():
+    assert isinstance(create_extraction_cache(Settings()), LocalExtractionCache)
+    assert create_extraction_cache(Settings(extraction_cache_size=0)) is None
+    with pytest.raises(ValueError, match="Unknown cache backend"):
+        create_extraction_cache(Settings(cache_backend="memcached"))
+
+
+class _FakeRedis:
+    """Emulates the get/set calls of redis.asyncio.Redis."""
+
+    def __init__(self, url):
+        self.url = url
+        self.store = {}
+        self.expiry = {}
+
+    @classmethod
+    def from_url(cls, url):
+        return cls(url)
+
+    async def get(self, key):
+        return self.store.get(key)
+
+    async def set(self, key, value, ex=None):
+        self.store[key] = value
+        self.expiry[key] = ex
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis_asyncio = types.ModuleType("redis.asyncio")
+    redis_asyncio.Redis = _FakeRedis
+    redis = types.ModuleType("redis")
+    redis.asyncio = redis_asyncio
+    monkeypatch.setitem(sys.modules, "redis", redis)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", redis_asyncio)
+
+
+def test_redis_cache_round_trips_json(fake_redis):
+    cache = create_extraction_cache(
+        Settings(cache_backend="redis", redis_url="redis://cache:6379/1")
+    )
+    assert isinstance(cache, RedisExtractionCache)
+
+    items = [{"pii": "x", "type": "email", "start": 0, "end": 1}]
+
+    async def run():
+        await cache.set("a", items)
+        return await cache.get("a"), await cache.get("b")
+
+    a, b = asyncio.run(run())
+    assert a == items
+    assert b is None
+    assert cache._redis.url == "redis://cache:6379/1"
+    assert isinstance(cache._redis.store["a"], bytes)
+    # A ttl of 0 stores results without expiry
+    assert cache._redis.expiry["a"] is None
+
+
+def test_redis_cache_sets_ttl(fake_redis):
+    cache = RedisExtractionCache("redis://localhost:6379/0", ttl=60)
+    asyncio.run(cache.set("a", []))
+    assert cache._redis.expiry["a"] == 60
+
+
+def test_redis_cache_requires_redis_package(monkeypatch):
+    monkeypatch.setitem(sys.modules, "redis", None)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", None)
+    with pytest.raises(ImportError, match="requires the 'redis' package"):
+        RedisExtractionCache("redis://localhost:6379/0")
@@ -58,6 +58,9 @@ def test_defaults_for_host_and_port(monkeypatch, tmp_path):
     s = Settings()
     assert s.host == "0.0.0.0"
     assert s.port == 8081
+    assert s.max_concurrent_llm == 16
+    assert s.extraction_cache_size == 4096
+    assert s.cache_backend == "local"
 
 
 def test_env_vars_override(monkeypatch, tmp_path):
@@ -1,5 +1,7 @@
+import asyncio
 import json
 import pytest
+from typing import Optional
 from pydantic import BaseModel, Field
 
 import src.masking as masking_mod
@@ -17,8 +19,10 @@ class _FakeCompletions:
     def __init__(self, content: str = None, to_raise: Exception | None = None):
         self._content = content
         self._to_raise = to_raise
+        self.calls = []
 
-    def parse(self, **kwargs):
+    async def parse(self, **kwargs):
+        self.calls.append(kwargs)
         if self._to_raise:
             raise self._to_raise
         return _FakeCompletion(self._content)
@@ -45,11 +49,112 @@ class _FakeClient:
         )()
 
 
+class _FakeBatchClient:
+    """Emulates the files/batches endpoints used by the OpenAI Batch API."""
+
+    def __init__(
+        self,
+        contents: list[str],
+        final_status: str = "completed",
+        retrieve_error: Optional[BaseException] = None,
+    ):
+        self.uploaded = None
+        self.retrieve_calls = 0
+        self.cancelled = []
+        self._retrieve_error = retrieve_error
+        self._contents = contents
+        self._final_status = final_status
+        client = self
+
+        class Files:
+            async def create(self, file, purpose):
+                client.uploaded = file[1].decode("utf-8")
+                return type("File", (), {"id": "file-in"})()
+
+            async def content(self, file_id):
+                custom_ids = [
+                    json.loads(line)["custom_id"]
+                    for line in client.uploaded.splitlines()
+                ]
+                # Return responses out of order to check they are re-sorted
+                lines = [
+                    json.dumps(
+                        {
+                            "custom_id": custom_id,
+                            "response": {
+                                "status_code": 200,
+                                "body": {
+                                    "choices": [{"message": {"content": content}}]
+                                },
+                            },
+                            "error": None,
+                        }
+                    )
+                    for custom_id, content in zip(custom_ids, client._contents)
+                ]
+                return type("Content", (), {"text": "\n".join(reversed(lines))})()
+
+        class Batches:
+            async def create(self, **kwargs):
+                return client._batch("validating")
+
+            async def retrieve(self, batch_id):
+                client.retrieve_calls += 1
+                if client._retrieve_error is not None:
+                    raise client._retrieve_error
+                return client._batch(client._final_status)
+
+            async def cancel(self, batch_id):
+                client.cancelled.append(batch_id)
+                return client._batch("cancelling")
+
+        self.files = Files()
+        self.batches = Batches()
+
+    def _batch(self, status: str):
+        output_file_id = "file-out" if status == "completed" else None
+        return type(
+            "Batch",
+            (),
+            {"id": "batch-1", "status": status, "output_file_id": output_file_id},
+        )()
+
+
+class _FakeStreamClient:
+    """Emulates client.chat.completions.create(..., stream=True)."""
+
+    def __init__(self, deltas: list[str]):
+        self.calls = []
+        client = self
+
+        class Completions:
+            async def create(self, **kwargs):
+                client.calls.append(kwargs)
+
+                async def chunks():
+                    for delta in deltas:
+                        message = type("Delta", (), {"content": delta})()
+                        choice = type("Choice", (), {"delta": message})()
+                        yield type("Chunk", (), {"choices": [choice]})()
+
+                return chunks()
+
+        self.chat = type("Chat", (), {"completions": Completions()})()
+
+
 class _DummySettings(Settings):
     # Avoid reading any .env by giving explicit defaults for required fields
     openai_base_url: str = "http://test"
     openai_api_key: str = "sk-test"
     openai_model_name: str = "gpt-test"
+    batch_api_poll_interval: float = 0
+
+
+@pytest.fixture(autouse=True)
+def clear_extraction_cache():
+    masking_mod.extraction_cache.clear()
+    yield
+    masking_mod.extraction_cache.clear()
 
 
 class PIIConfig(BaseModel):
@@ -57,6 +162,11 @@ class PIIConfig(BaseModel):
     phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
 
 
+class DigitsConfig(BaseModel):
+    phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
+    ip_address: str = Field(default="", json_schema_extra={"mask": "[IP]"})
+
+
 class NoMaskConfig(BaseModel):
     email: str = Field(default="")  # no json_schema_extra -> no mask
 
@@ -75,6 +185,33 @@ def test_get_pii_identification_system_prompt():
     # basic sanity checks
     assert "identifying PII" in s or "PII" in s
     assert isinstance(s, str) and len(s) > 10
+    # Built once, so repeated calls return the very same string
+    assert masking_mod.get_pii_identification_system_prompt() is s
+
+
+def test_extraction_messages_share_a_constant_system_prefix():
+    system_prompt = masking_mod.get_pii_identification_system_prompt()
+    messages = [
+        masking_mod.get_pii_extraction_messages("Hi alice@example.com", "email"),
+        masking_mod.get_pii_extraction_messages("Call 123-456", "email, phone"),
+        masking_mod.get_pii_packed_extraction_messages(["a", "b"], "phone"),
+    ]
+
+    # Provider prompt caching needs the same leading message on every request
+    assert all(m[0] == {"role": "system", "content": system_prompt} for m in messages)
+    assert all(m[0]["content"] is system_prompt for m in messages)
+    assert "alice@example.com" not in system_prompt
+
+
+def test_prefilter_passes_values_the_system_prompt_asks_for():
+    class PromptConfig(BaseModel):
+        phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
+        credit_card: str = Field(default="", json_schema_extra={"mask": "[CC]"})
+
+    prefilter = masking_mod.get_pii_prefilter(PromptConfig)
+    assert prefilter("call (030) 123-4567")
+    assert prefilter("card 4111.1111.1111.1111")
+    assert prefilter("card 4111 1111 1111 1111")
 
 
 def test_get_pii_extraction_instruct_prompt():
@@ -87,59 +224,304 @@ def test_get_pii_extraction_instruct_prompt():
 
 
 # ---------------------------
-# JSON response parser
+# extract_pii
 # ---------------------------
 
 
-def test_parse_json_response_plain_json():
-    payload = [{"pii": "alice@example.com", "type": "email"}]
-    out = masking_mod.parse_json_response(json.dumps(payload))
-    assert out == payload
+def test_extract_pii_success(monkeypatch):
+    # Arrange: fake OpenAI client returning the structured JSON object
+    response_items = [
+        {"pii": "alice@example.com", "type": "email", "start": 6, "end": 23}
+    ]
+    fake_client = _FakeClient(content=json.dumps({"detected_pii": response_items}))
 
+    # Patch the global client used by the module
+    monkeypatch.setattr(masking_mod, "client", fake_client)
 
-def test_parse_json_response_fenced_block_with_lang():
-    payload = [{"pii": "1234567890", "type": "phone"}]
-    raw = "```json\n" + json.dumps(payload) + "\n```"
-    out = masking_mod.parse_json_response(raw)
-    assert out == payload
+    # Use dummy settings to avoid real env
+    s = _DummySettings()
 
+    out = asyncio.run(
+        masking_mod.extract_pii("Hello alice@example.com", PIIConfig, settings=s)
+    )
+    assert out == response_items
 
-def test_parse_json_response_fenced_block_without_lang():
-    payload = [{"pii": "1234567890", "type": "phone"}]
-    raw = "```\n" + json.dumps(payload) + "\n```"
-    out = masking_mod.parse_json_response(raw)
-    assert out == payload
+    # Structured output restricts reported types to the configured ones
+    (call,) = fake_client.beta.chat.completions.calls
+    assert call["prompt_cache_key"] == masking_mod.get_prompt_cache_key(PIIConfig)
+    schema = call["response_format"]["json_schema"]["schema"]
+    item_schema = schema["properties"]["detected_pii"]["items"]
+    assert item_schema["properties"]["type"]["enum"] == ["email", "phone"]
+    assert "of the following types: email, phone." in call["messages"][1]["content"]
+
+    # With the prefilter, the LLM is only asked for types the text may contain
+    fake_client.beta.chat.completions.calls.clear()
+    s = _DummySettings(enable_prefilter=True)
+    asyncio.run(masking_mod.extract_pii("Hello bob@example.com", PIIConfig, s))
+    (call,) = fake_client.beta.chat.completions.calls
+    schema = call["response_format"]["json_schema"]["schema"]
+    item_schema = schema["properties"]["detected_pii"]["items"]
+    assert item_schema["properties"]["type"]["enum"] == ["email"]
+
+
+def test_get_active_pii_types_checks_each_type():
+    assert masking_mod.get_active_pii_types("no candidates", PIIConfig) == ["email"]
+    assert masking_mod.get_active_pii_types("Call 555 123 456", PIIConfig) == [
+        "email",
+        "phone",
+    ]
+    assert masking_mod.get_active_pii_types("a@b.com or 555 123 456", PIIConfig) == [
+        "email",
+        "phone",
+    ]
 
 
-def test_parse_json_response_invalid_raises_valueerror():
-    with pytest.raises(ValueError):
-        masking_mod.parse_json_response("this is not json")
+def test_get_active_pii_types_never_drops_types_without_prefilter():
+    class MixedConfig(BaseModel):
+        first_name: str = Field(default="", json_schema_extra={"mask": "[FN]"})
+        email: str = Field(default="", json_schema_extra={"mask": "[EMAIL]"})
+        ip_address: str = Field(default="", json_schema_extra={"mask": "[IP]"})
+        credit_card: str = Field(default="", json_schema_extra={"mask": "[CC]"})
 
+    assert masking_mod.get_active_pii_types("IP 10.0.0.1", MixedConfig) == [
+        "first_name",
+        "email",
+        "ip_address",
+    ]
+    assert masking_mod.get_active_pii_types("ask bob", MixedConfig) == [
+        "first_name",
+        "email",
+    ]
 
-# ---------------------------
-# extract_pii
-# ---------------------------
 
+def test_extract_pii_prefilter_is_off_by_default(monkeypatch):
+    fake_client = _FakeClient(content=json.dumps({"detected_pii": []}))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
 
-def test_extract_pii_success(monkeypatch):
-    # Arrange: fake OpenAI client returning JSON list
-    response_items = [{"pii": "alice@example.com", "type": "email"}]
-    fake_client = _FakeClient(content=json.dumps(response_items))
+    s = _DummySettings()
+    assert not s.enable_prefilter
+    out = asyncio.run(masking_mod.extract_pii("no candidates", PIIConfig, s))
+    assert out == []
 
-    # Patch the global client used by the module
+    # Every configured type is requested
+    (call,) = fake_client.beta.chat.completions.calls
+    schema = call["response_format"]["json_schema"]["schema"]
+    item_schema = schema["properties"]["detected_pii"]["items"]
+    assert item_schema["properties"]["type"]["enum"] == ["email", "phone"]
+
+
+def test_extract_pii_caches_results(monkeypatch):
+    response_items = [
+        {"pii": "alice@example.com", "type": "email", "start": 3, "end": 20}
+    ]
+    fake_client = _FakeClient(content=json.dumps({"detected_pii": response_items}))
     monkeypatch.setattr(masking_mod, "client", fake_client)
 
-    # Use dummy settings to avoid real env
     s = _DummySettings()
 
-    out = masking_mod.extract_pii("Hello alice@example.com", PIIConfig, settings=s)
-    assert out == response_items
+    async def run():
+        first = await masking_mod.extract_pii("Hi alice@example.com", PIIConfig, s)
+        second = await masking_mod.extract_pii("Hi alice@example.com", PIIConfig, s)
+        other = await masking_mod.extract_pii("Bye alice@example.com", PIIConfig, s)
+        return first, second, other
+
+    first, second, other = asyncio.run(run())
+    assert first == second == response_items
+    # Offsets that do not match the text are re-anchored
+    assert other == [
+        {"pii": "alice@example.com", "type": "email", "start": 4, "end": 21}
+    ]
+    # Second call for the same text is served from the cache
+    assert len(fake_client.beta.chat.completions.calls) == 2
+
+
+def test_pii_item_parser_yields_items_across_chunk_boundaries():
+    response = json.dumps(
+        {
+            "detected_pii": [
+                {"pii": 'a"}{b', "type": "name", "start": 0, "end": 5},
+                {"pii": "x\\]y", "type": "name", "start": 7, "end": 11},
+            ]
+        }
+    )
+    parser = masking_mod.PIIItemParser()
+    items = []
+    for i in range(0, len(response), 3):
+        items.extend(parser.feed(response[i : i + 3]))
+    parser.close()
+
+    assert items == json.loads(response)["detected_pii"]
+
+
+def test_pii_item_parser_rejects_truncated_response():
+    parser = masking_mod.PIIItemParser()
+    parser.feed('{"detected_pii": [{"pii": "a", "type": "name"}')
+    with pytest.raises(ValueError, match="incomplete stream"):
+        parser.close()
+
+
+def test_extract_pii_streamed_response_is_located_and_cached(monkeypatch):
+    content = json.dumps(
+        {
+            "detected_pii": [
+                {"pii": "bob@example.com", "type": "email", "start": 0, "end": 0},
+                {"pii": "bob@example.com", "type": "email", "start": 0, "end": 0},
+            ]
+        }
+    )
+    fake_client = _FakeStreamClient([content[:20], content[20:50], content[50:]])
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings(stream_min_chars=1)
+    text = "bob@example.com and bob@example.com"
+
+    async def run():
+        streamed = await masking_mod.extract_pii(text, PIIConfig, s)
+        cached = await masking_mod.extract_pii(text, PIIConfig, s)
+        return streamed, cached
+
+    streamed, cached = asyncio.run(run())
+    assert [(item["start"], item["end"]) for item in streamed] == [(0, 15), (20, 35)]
+    assert cached == streamed
+    (call,) = fake_client.calls
+    assert call["stream"] is True
+
+
+def test_extract_pii_streams_long_texts(monkeypatch):
+    items = [{"pii": "alice@example.com", "type": "email", "start": 3, "end": 20}]
+    fake_client = _FakeStreamClient([json.dumps({"detected_pii": items})])
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings(stream_min_chars=10)
+    out = asyncio.run(masking_mod.extract_pii("Hi alice@example.com", PIIConfig, s))
+    assert out == items
+    assert len(fake_client.calls) == 1
+
+
+def test_extract_pii_invalid_structured_response_raises_valueerror(monkeypatch):
+    fake_client = _FakeClient(content=json.dumps([{"pii": "x", "type": "email"}]))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    with pytest.raises(ValueError, match="Invalid structured response"):
+        asyncio.run(
+            masking_mod.extract_pii("hello alice@example.com", PIIConfig, settings=s)
+        )
+
+
+def test_get_prompt_cache_key_depends_on_pii_types():
+    key = masking_mod.get_prompt_cache_key(PIIConfig)
+    assert key.startswith("pii-")
+    assert masking_mod.get_prompt_cache_key(PIIConfig) == key
+    assert masking_mod.get_prompt_cache_key(NoMaskConfig) != key
+
+
+def test_extract_pii_skips_llm_without_candidates(monkeypatch):
+    fake_client = _FakeClient(to_raise=AssertionError("LLM should not be called"))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings(enable_prefilter=True)
+    out = asyncio.run(
+        masking_mod.extract_pii("no contact details here", DigitsConfig, settings=s)
+    )
+    assert out == []
+
+
+def test_get_pii_prefilter_requires_patterns_for_all_types():
+    class WithUnknownType(BaseModel):
+        email: str = Field(default="", json_schema_extra={"mask": "[EMAIL]"})
+        company: str = Field(default="", json_schema_extra={"mask": "[COMPANY]"})
+
+    # Unknown types have no prefilter, so every text goes to the LLM
+    assert masking_mod.get_pii_prefilter(WithUnknownType) is None
+
+    prefilter = masking_mod.get_pii_prefilter(DigitsConfig)
+    assert prefilter("call +49 (0)30 1234")
+    assert prefilter("server at 10.0.0.1")
+    # Contains candidate digits, but no phone-like run
+    assert not prefilter("call me maybe 12")
+    assert not prefilter("no candidate characters at all")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "０３－１２３４－５６７８",
+        "030–123–45",
+        "call five five five one two three four",
+    ],
+)
+def test_default_settings_send_unusual_phone_numbers_to_llm(monkeypatch, text):
+    class PhoneConfig(BaseModel):
+        phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
+
+    fake_client = _FakeClient(content=json.dumps({"detected_pii": []}))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    asyncio.run(masking_mod.extract_pii(text, PhoneConfig, _DummySettings()))
+    assert len(fake_client.beta.chat.completions.calls) == 1
+
+
+def test_prefilter_accepts_any_separators_between_digits():
+    class CardConfig(BaseModel):
+        phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
+        credit_card: str = Field(default="", json_schema_extra={"mask": "[CC]"})
+
+    for text in (
+        "０３－１２３４－５６７８",
+        "030–123–45",
+        "tel. 030 · 123 · 45",
+        "card 4111—1111—1111—1111",
+        "card 4111_1111_1111_1111",
+    ):
+        assert masking_mod.get_active_pii_types(text, CardConfig)[0] == "phone"
+
+    card_types = masking_mod.get_active_pii_types("4111–1111–1111–1111", CardConfig)
+    assert card_types == ["phone", "credit_card"]
+
+
+def test_prefilter_passes_non_ascii_digits():
+    class PhoneConfig(BaseModel):
+        phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
+
+    arabic_indic = "اتصل على ٠١٢٣٤٥٦٧٨٩"
+    full_width = "電話番号 ０３１２３４５６７８"
+    for text in (arabic_indic, full_width):
+        assert masking_mod.get_pii_prefilter(PhoneConfig)(text)
+        assert masking_mod.get_active_pii_types(text, PhoneConfig) == ["phone"]
+        assert masking_mod.get_active_pii_types(text, DigitsConfig) == ["phone"]
+
+    # Non-ASCII texts without any digit run are still skipped
+    assert masking_mod.get_active_pii_types("Grüße aus Köln", PhoneConfig) == []
+
+
+def test_prefilter_never_skips_lowercase_names_or_obfuscated_emails(monkeypatch):
+    class ChatConfig(BaseModel):
+        first_name: str = Field(default="", json_schema_extra={"mask": "[FN]"})
+        email: str = Field(default="", json_schema_extra={"mask": "[EMAIL]"})
+        phone: str = Field(default="", json_schema_extra={"mask": "[PHONE]"})
+
+    assert masking_mod.get_pii_prefilter(ChatConfig) is None
+
+    items = [{"pii": "john", "type": "first_name", "start": 12, "end": 16}]
+    fake_client = _FakeClient(content=json.dumps({"detected_pii": items}))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    out = asyncio.run(
+        masking_mod.extract_pii("please call john tomorrow", ChatConfig, s)
+    )
+    assert out == items
+    asyncio.run(
+        masking_mod.extract_pii("write to jane at example dot com", ChatConfig, s)
+    )
+    assert len(fake_client.beta.chat.completions.calls) == 2
 
 
 def test_extract_pii_no_pii_types_raises_valueerror():
     s = _DummySettings()
     with pytest.raises(ValueError, match="No PII types defined"):
-        masking_mod.extract_pii("hello", EmptyConfig, settings=s)
+        asyncio.run(masking_mod.extract_pii("hello", EmptyConfig, settings=s))
 
 
 def test_extract_pii_openai_error_bubbles(monkeypatch):
@@ -150,7 +532,223 @@ def test_extract_pii_openai_error_bubbles(monkeypatch):
 
     s = _DummySettings()
     with pytest.raises(masking_mod.OpenAIError):
-        masking_mod.extract_pii("hello", PIIConfig, settings=s)
+        asyncio.run(
+            masking_mod.extract_pii("hello alice@example.com", PIIConfig, settings=s)
+        )
+
+
+# ---------------------------
+# extract_pii_packed
+# ---------------------------
+
+
+def test_get_pii_packed_extraction_instruct_prompt_numbers_texts():
+    p = masking_mod.get_pii_packed_extraction_instruct_prompt(
+        ["Hi alice@example.com", "Call 123-456"], "email, phone"
+    )
+    assert "### DOC 1\nHi alice@example.com" in p
+    assert "### DOC 2\nCall 123-456" in p
+    assert "email, phone" in p
+
+
+def test_extract_pii_drops_malformed_items(monkeypatch):
+    items = [
+        {"pii": "alice@example.com", "type": "email", "start": 3, "end": 20},
+        {"pii": 42, "type": "email"},
+        "alice@example.com",
+    ]
+    fake_client = _FakeClient(content=json.dumps({"detected_pii": items}))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    out = asyncio.run(masking_mod.extract_pii("Hi alice@example.com", PIIConfig, s))
+    assert out == items[:1]
+
+
+def test_parse_pii_response_rejects_non_list():
+    with pytest.raises(ValueError, match="not a list"):
+        masking_mod.parse_pii_response(json.dumps({"detected_pii": {"pii": "x"}}))
+
+
+def test_extract_pii_packed_success(monkeypatch):
+    first = [{"pii": "alice@example.com", "type": "email", "start": 3, "end": 20}]
+    second = [{"pii": "555 123 456", "type": "phone", "start": 5, "end": 16}]
+    fake_client = _FakeClient(content=json.dumps({"1": first, "2": second}))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    texts = ["Hi alice@example.com", "Call 555 123 456"]
+    out = asyncio.run(masking_mod.extract_pii_packed(texts, PIIConfig, settings=s))
+    assert out == [first, second]
+
+    (call,) = fake_client.beta.chat.completions.calls
+    prompt = call["messages"][1]["content"]
+    assert "### DOC 2\nCall 555 123 456" in prompt
+    schema = call["response_format"]["json_schema"]["schema"]
+    assert schema["required"] == ["1", "2"]
+
+    # Packed results populate the per-text extraction cache
+    cached = asyncio.run(
+        masking_mod.extract_pii("Hi alice@example.com", PIIConfig, settings=s)
+    )
+    assert cached == first
+    assert len(fake_client.beta.chat.completions.calls) == 1
+
+
+def test_extract_pii_packed_skips_prefiltered_texts(monkeypatch):
+    phone = [{"pii": "555 123 456", "type": "phone", "start": 5, "end": 16}]
+    fake_client = _FakeClient(content=json.dumps({"1": phone}))
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings(enable_prefilter=True)
+    texts = ["no candidates", "Call 555 123 456"]
+    out = asyncio.run(masking_mod.extract_pii_packed(texts, DigitsConfig, settings=s))
+    assert out == [[], phone]
+
+    # The prefiltered text is not packed into the prompt
+    (call,) = fake_client.beta.chat.completions.calls
+    prompt = call["messages"][1]["content"]
+    assert "### DOC 1\nCall 555 123 456" in prompt
+    assert "no candidates" not in prompt
+
+
+def test_extract_pii_packed_missing_document_falls_back_per_text(monkeypatch):
+    fake_client = _FakeClient()
+    completions = fake_client.beta.chat.completions
+    single = [{"pii": "bob@example.com", "type": "email", "start": 3, "end": 18}]
+
+    async def parse(**kwargs):
+        completions.calls.append(kwargs)
+        if kwargs["response_format"]["json_schema"]["name"] == "pii_lists":
+            return _FakeCompletion(json.dumps({"1": []}))
+        return _FakeCompletion(json.dumps({"detected_pii": single}))
+
+    monkeypatch.setattr(completions, "parse", parse)
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    texts = ["Hi alice@example.com", "Hi bob@example.com"]
+    out = asyncio.run(masking_mod.extract_pii_packed(texts, PIIConfig, settings=s))
+    assert out == [[], single]
+
+    # Only the dropped document is sent again on its own
+    packed_call, single_call = completions.calls
+    assert "Hi bob@example.com" in single_call["messages"][1]["content"]
+    assert "alice" not in single_call["messages"][1]["content"]
+
+
+def test_extract_pii_packed_fallback_calls_run_one_at_a_time(monkeypatch):
+    fake_client = _FakeClient()
+    completions = fake_client.beta.chat.completions
+    in_flight = 0
+    peak = 0
+
+    async def parse(**kwargs):
+        nonlocal in_flight, peak
+        completions.calls.append(kwargs)
+        if kwargs["response_format"]["json_schema"]["name"] == "pii_lists":
+            return _FakeCompletion(json.dumps({}))
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _FakeCompletion(json.dumps({"detected_pii": []}))
+
+    monkeypatch.setattr(completions, "parse", parse)
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    texts = ["Hi alice@example.com", "Hi bob@example.com", "Hi eve@example.com"]
+    out = asyncio.run(masking_mod.extract_pii_packed(texts, PIIConfig, settings=s))
+    assert out == [[], [], []]
+    assert len(completions.calls) == 4
+    assert peak == 1
+
+
+# ---------------------------
+# extract_pii_batch
+# ---------------------------
+
+
+def test_extract_pii_batch_success(monkeypatch):
+    first = [{"pii": "alice@example.com", "type": "email", "start": 6, "end": 23}]
+    second = [{"pii": "123-456", "type": "phone", "start": 5, "end": 12}]
+    fake_client = _FakeBatchClient(
+        [json.dumps({"detected_pii": first}), json.dumps({"detected_pii": second})]
+    )
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    out = asyncio.run(
+        masking_mod.extract_pii_batch(
+            ["Hello alice@example.com", "Call 123-456"], PIIConfig, settings=s
+        )
+    )
+
+    assert out == [first, second]
+    assert fake_client.retrieve_calls == 1
+    requests = [json.loads(line) for line in fake_client.uploaded.splitlines()]
+    assert [r["custom_id"] for r in requests] == ["0", "1"]
+    assert requests[0]["url"] == "/v1/chat/completions"
+    assert requests[0]["body"]["model"] == "gpt-test"
+    assert requests[0]["body"]["response_format"]["type"] == "json_schema"
+
+
+def test_extract_pii_batch_skips_prefiltered_and_cached_texts(monkeypatch):
+    items = [{"pii": "123-456", "type": "phone", "start": 5, "end": 12}]
+    fake_client = _FakeBatchClient([json.dumps({"detected_pii": items})])
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings(enable_prefilter=True)
+    texts = ["no numbers here", "Call 123-456"]
+    out = asyncio.run(masking_mod.extract_pii_batch(texts, DigitsConfig, settings=s))
+
+    assert out == [[], items]
+    requests = [json.loads(line) for line in fake_client.uploaded.splitlines()]
+    assert [r["custom_id"] for r in requests] == ["1"]
+
+    # A second run is answered from the cache without a batch job
+    monkeypatch.setattr(
+        masking_mod, "client", _FakeClient(to_raise=AssertionError("no batch job"))
+    )
+    out = asyncio.run(masking_mod.extract_pii_batch(texts, DigitsConfig, settings=s))
+    assert out == [[], items]
+
+
+def test_extract_pii_batch_failed_job_raises(monkeypatch):
+    fake_client = _FakeBatchClient(
+        [json.dumps({"detected_pii": []})], final_status="failed"
+    )
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    with pytest.raises(masking_mod.OpenAIError, match="failed"):
+        asyncio.run(masking_mod.extract_pii_batch(["hello"], PIIConfig, settings=s))
+    assert fake_client.cancelled == []
+
+
+def test_extract_pii_batch_cancels_job_after_max_wait(monkeypatch):
+    fake_client = _FakeBatchClient(
+        [json.dumps({"detected_pii": []})], final_status="in_progress"
+    )
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings(batch_api_max_wait=0)
+    with pytest.raises(masking_mod.OpenAIError, match="did not finish"):
+        asyncio.run(masking_mod.extract_pii_batch(["hello"], PIIConfig, settings=s))
+    assert fake_client.cancelled == ["batch-1"]
+
+
+def test_extract_pii_batch_cancels_job_when_cancelled(monkeypatch):
+    fake_client = _FakeBatchClient(
+        [json.dumps({"detected_pii": []})], retrieve_error=asyncio.CancelledError()
+    )
+    monkeypatch.setattr(masking_mod, "client", fake_client)
+
+    s = _DummySettings()
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(masking_mod.extract_pii_batch(["hello"], PIIConfig, settings=s))
+    assert fake_client.cancelled == ["batch-1"]
 
 
 # ---------------------------
@@ -168,6 +766,99 @@ def test_mask_pii_happy_path():
     assert masked == "Contact me at [EMAIL] or [PHONE]."
 
 
+def test_get_mask_table_is_cached_per_config():
+    table = masking_mod.get_mask_table(PIIConfig)
+    assert table == {"email": "[EMAIL]", "phone": "[PHONE]"}
+    assert masking_mod.get_mask_table(PIIConfig) is table
+    assert masking_mod.get_mask_table(NoMaskConfig) == {"email": None}
+
+
+def test_mask_pii_prefers_longest_value_and_does_not_rescan_masks():
+    text = "Alice Smith wrote to EMAIL"
+    extracted = [
+        {"pii": "Alice", "type": "email"},
+        {"pii": "Alice Smith", "type": "phone"},
+        # Matches text inside the mask inserted for another value
+        {"pii": "EMAIL", "type": "phone"},
+    ]
+    masked = masking_mod.mask_pii(text, extracted, PIIConfig)
+    assert masked == "[PHONE] wrote to [PHONE]"
+
+
+def test_mask_pii_masks_every_occurrence_and_resolves_overlaps():
+    text = "Alice Smith Jr met Alice Smith at alice@example.com, alice@example.com"
+    extracted = [
+        {"pii": "Alice Smith", "type": "email"},
+        # Overlaps the end of the first match, which starts further left, so the
+        # union is masked with the mask of the leftmost match
+        {"pii": "Smith Jr", "type": "phone"},
+        {"pii": "alice@example.com", "type": "email"},
+    ]
+    masked = masking_mod.mask_pii(text, extracted, PIIConfig)
+    assert masked == "[EMAIL] met [EMAIL] at [EMAIL], [EMAIL]"
+
+
+def test_mask_pii_masks_union_of_overlapping_anchored_spans():
+    text = "abcdefgh and bcdef"
+    extracted = [
+        {"pii": "abc", "type": "email", "start": 0, "end": 3},
+        {"pii": "bcdef", "type": "phone", "start": 1, "end": 6},
+    ]
+    masked = masking_mod.mask_pii(text, extracted, PIIConfig)
+    # The scanned "bcdef" at 13 is masked as well, with its own mask
+    assert masked == "[EMAIL]gh and [PHONE]"
+
+
+def test_mask_pii_uses_offsets_for_values_in_several_roles():
+    text = "Call 123-456 and mail 123-456@example.com, or 123-456 again"
+    extracted = [
+        {"pii": "123-456", "type": "phone", "start": 5, "end": 12},
+        {"pii": "123-456", "type": "email", "start": 46, "end": 53},
+        # Invalid offsets fall back to scanning for the value
+        {"pii": "123-456@example.com", "type": "email", "start": 0, "end": 3},
+    ]
+    masked = masking_mod.mask_pii(text, extracted, PIIConfig)
+    assert masked == "Call [PHONE] and mail [EMAIL], or [EMAIL] again"
+
+
+def test_locate_pii_reanchors_invalid_offsets():
+    text = "Bob and Bob"
+    extracted = [
+        {"pii": "Bob", "type": "phone", "start": 0, "end": 3},
+        {"pii": "Bob", "type": "phone"},
+        {"pii": "Bob", "type": "phone", "start": 99, "end": 102},
+        {"pii": "Eve", "type": "phone", "start": 0, "end": 3},
+    ]
+    out = masking_mod.locate_pii(text, extracted)
+    assert [(p.get("start"), p.get("end")) for p in out] == [
+        (0, 3),
+        (8, 11),
+        (0, 3),
+        (None, None),
+    ]
+
+
+def test_mask_pii_reuses_automaton_for_same_detections():
+    masking_mod.get_mask_automaton.cache_clear()
+    extracted = [{"pii": "alice@example.com", "type": "email"}]
+    first = masking_mod.mask_pii("Mail alice@example.com", extracted, PIIConfig)
+    second = masking_mod.mask_pii("alice@example.com wrote", extracted, PIIConfig)
+
+    assert first == "Mail [EMAIL]"
+    assert second == "[EMAIL] wrote"
+    info = masking_mod.get_mask_automaton.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_mask_pii_empty_extracted_returns_text_unchanged():
+    class Config:
+        @property
+        def model_fields(self):
+            raise AssertionError("config must not be inspected")
+
+    assert masking_mod.mask_pii("hello", [], Config()) == "hello"
+
+
 def test_mask_pii_missing_mask_keeps_text():
     text = "Contact me at alice@example.com"
     extracted = [{"pii": "alice@example.com", "type": "email"}]
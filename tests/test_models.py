@@ -40,6 +40,12 @@ def test_mask_request_parses_and_validates():
         MaskRequest(texts=[123], pii_config={"email": {"mask": "[X]"}})  # type: ignore[list-item]
 
 
+def test_mask_request_accepts_config_id_instead_of_pii_config():
+    req = MaskRequest(texts=["hello"], config_id="abc")
+    assert req.config_id == "abc"
+    assert req.pii_config is None
+
+
 def test_mask_response_validates_nested_detected_pii():
     resp = MaskResponse(
         original_texts=["a", "b"],
@@ -87,3 +93,40 @@ def test_create_dynamic_pii_config_empty_returns_model_with_no_fields():
     # With no fields, instance can be created without values
     instance = Dynamic()
     assert instance.model_dump() == {}
+
+
+def test_create_dynamic_pii_config_reuses_class_for_same_config():
+    first = create_dynamic_pii_config(
+        {
+            "email": PIITypeConfig(mask="[EMAIL]"),
+            "first_name": PIITypeConfig(mask="[FN]"),
+        }
+    )
+    # Same types and masks in a different order -> same class
+    second = create_dynamic_pii_config(
+        {
+            "first_name": PIITypeConfig(mask="[FN]"),
+            "email": PIITypeConfig(mask="[EMAIL]"),
+        }
+    )
+    assert first is second
+
+    # A different mask -> a different class
+    other = create_dynamic_pii_config(
+        {
+            "email": PIITypeConfig(mask="[MAIL]"),
+            "first_name": PIITypeConfig(mask="[FN]"),
+        }
+    )
+    assert other is not first
+    assert other.model_fields["email"].json_schema_extra == {"mask": "[MAIL]"}
+
+
+def test_create_dynamic_pii_config_models_are_frozen_and_strict():
+    Dynamic = create_dynamic_pii_config({"email": PIITypeConfig(mask="[EMAIL]")})
+    instance = Dynamic(email="a@b.c")
+
+    with pytest.raises(ValidationError):
+        instance.email = "x@y.z"
+    with pytest.raises(ValidationError):
+        Dynamic(email="a@b.c", phone="123")
@@ -1,14 +1,21 @@
 # tests/api/test_server.py
+import asyncio
+import json
 import pytest
-from fastapi.testclient import TestClient
+import pytest_asyncio
+from httpx2 import ASGITransport, AsyncClient
 
 from src.server import app as fastapi_app
 import src.server as server_module  # for monkeypatching names used inside the endpoint
 
 
-@pytest.fixture()
-def client():
-    return TestClient(fastapi_app)
+@pytest_asyncio.fixture()
+async def client():
+    # Calls the ASGI app in-process on the test's event loop, no server thread
+    async with AsyncClient(
+        transport=ASGITransport(app=fastapi_app), base_url="http://test"
+    ) as c:
+        yield c
 
 
 @pytest.fixture()
@@ -20,20 +27,22 @@ def dummy_config_class():
     return DynamicPIIConfig
 
 
-def test_health(client):
-    r = client.get("/health")
+@pytest.mark.asyncio
+async def test_health(client):
+    r = await client.get("/health")
     assert r.status_code == 200
     assert r.json() == {"status": "healthy"}
 
 
-def test_mask_pii_success(monkeypatch, client, dummy_config_class):
+@pytest.mark.asyncio
+async def test_mask_pii_success(monkeypatch, client, dummy_config_class):
     # Arrange: dynamic config creation
     monkeypatch.setattr(
         server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
     )
 
     # Arrange: extract & mask behavior
-    def fake_extract_pii(text, Config):
+    async def fake_extract_pii(text, Config):
         return (
             [{"type": "email", "pii": "alice@example.com"}] if "alice@" in text else []
         )
@@ -52,7 +61,7 @@ def test_mask_pii_success(monkeypatch, client, dummy_config_class):
         "pii_config": {"email": {"mask": "[EMAIL]"}},
     }
 
-    r = client.post("/mask-pii", json=payload)
+    r = await client.post("/mask-pii", json=payload)
     assert r.status_code == 200
     body = r.json()
     assert body["original_texts"] == payload["texts"]
@@ -60,30 +69,225 @@ def test_mask_pii_success(monkeypatch, client, dummy_config_class):
     assert body["detected_pii"] == [[{"type": "email", "pii": "alice@example.com"}], []]
 
 
-def test_mask_pii_empty_config_400(client):
+@pytest.mark.asyncio
+async def test_mask_pii_response_matches_validated_model(
+    monkeypatch, client, dummy_config_class
+):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+
+    async def fake_extract_pii(text, Config):
+        return [{"pii": "Zoë", "type": "email", "start": 3, "end": 6}]
+
+    monkeypatch.setattr(server_module, "extract_pii", fake_extract_pii)
+    monkeypatch.setattr(
+        server_module, "mask_pii", lambda text, detected, Config: "Hi [EMAIL]"
+    )
+
+    payload = {"texts": ["Hi Zoë"], "pii_config": {"email": {"mask": "[EMAIL]"}}}
+
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 200
+
+    # The endpoint skips response model validation but must produce the same bytes
+    expected = server_module.MaskResponse(
+        original_texts=["Hi Zoë"],
+        masked_texts=["Hi [EMAIL]"],
+        detected_pii=[[{"pii": "Zoë", "type": "email", "start": 3, "end": 6}]],
+    )
+    assert r.content == expected.model_dump_json().encode("utf-8")
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_bounds_concurrent_extraction(
+    monkeypatch, client, dummy_config_class
+):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+    monkeypatch.setattr(server_module.settings, "max_concurrent_llm", 2)
+
+    in_flight = 0
+    peak = 0
+
+    async def fake_extract_pii(text, Config):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return []
+
+    monkeypatch.setattr(server_module, "extract_pii", fake_extract_pii)
+    monkeypatch.setattr(server_module, "mask_pii", lambda text, detected, Config: text)
+
+    payload = {
+        "texts": [f"text {i}" for i in range(6)],
+        "pii_config": {"email": {"mask": "[EMAIL]"}},
+    }
+
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 200
+    assert r.json()["masked_texts"] == payload["texts"]
+    assert peak == 2
+
+
+@pytest.mark.asyncio
+async def test_llm_semaphore_is_shared_across_requests(monkeypatch):
+    monkeypatch.setattr(server_module.settings, "max_concurrent_llm", 3)
+
+    first = server_module.get_llm_semaphore()
+    second = server_module.get_llm_semaphore()
+    monkeypatch.setattr(server_module.settings, "max_concurrent_llm", 4)
+    resized = server_module.get_llm_semaphore()
+
+    assert first is second
+    assert resized is not first
+    assert resized._value == 4
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_deduplicates_texts(monkeypatch, client, dummy_config_class):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+
+    calls = []
+
+    async def fake_extract_pii(text, Config):
+        calls.append(text)
+        return (
+            [{"type": "email", "pii": "alice@example.com"}] if "alice@" in text else []
+        )
+
+    monkeypatch.setattr(server_module, "extract_pii", fake_extract_pii)
+    monkeypatch.setattr(server_module, "mask_pii", lambda text, detected, Config: text)
+
+    payload = {
+        "texts": ["Hi alice@example.com", "No PII", "Hi alice@example.com"],
+        "pii_config": {"email": {"mask": "[EMAIL]"}},
+    }
+
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 200
+    assert sorted(calls) == ["Hi alice@example.com", "No PII"]
+    assert r.json()["detected_pii"] == [
+        [{"type": "email", "pii": "alice@example.com"}],
+        [],
+        [{"type": "email", "pii": "alice@example.com"}],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_packs_texts(monkeypatch, client, dummy_config_class):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+    monkeypatch.setattr(server_module.settings, "pack_size", 2)
+
+    packs = []
+
+    async def fake_extract_pii_packed(texts, Config):
+        packs.append(texts)
+        return [
+            [{"type": "email", "pii": "alice@example.com"}] if "alice@" in t else []
+            for t in texts
+        ]
+
+    async def fail_extract_pii(text, Config):
+        raise AssertionError("per-text extraction should not be used")
+
+    monkeypatch.setattr(server_module, "extract_pii_packed", fake_extract_pii_packed)
+    monkeypatch.setattr(server_module, "extract_pii", fail_extract_pii)
+    monkeypatch.setattr(server_module, "mask_pii", lambda text, detected, Config: text)
+
+    payload = {
+        "texts": ["a", "Hi alice@example.com", "b"],
+        "pii_config": {"email": {"mask": "[EMAIL]"}},
+    }
+
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 200
+    assert sorted(packs) == [["a", "Hi alice@example.com"], ["b"]]
+    assert r.json()["detected_pii"] == [
+        [],
+        [{"type": "email", "pii": "alice@example.com"}],
+        [],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_large_payload_uses_batch_api(
+    monkeypatch, client, dummy_config_class
+):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+    monkeypatch.setattr(server_module.settings, "batch_api_threshold", 1)
+
+    async def fake_extract_pii_batch(texts, Config):
+        return [[{"type": "email", "pii": "alice@example.com"}], []]
+
+    async def fail_extract_pii(text, Config):
+        raise AssertionError("per-text extraction should not be used")
+
+    monkeypatch.setattr(server_module, "extract_pii_batch", fake_extract_pii_batch)
+    monkeypatch.setattr(server_module, "extract_pii", fail_extract_pii)
+    monkeypatch.setattr(server_module, "mask_pii", lambda text, detected, Config: text)
+
+    payload = {
+        "texts": ["Hi alice@example.com", "No PII"],
+        "pii_config": {"email": {"mask": "[EMAIL]"}},
+    }
+
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 200
+    assert r.json()["detected_pii"] == [
+        [{"type": "email", "pii": "alice@example.com"}],
+        [],
+    ]
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_invalid_body_422(client):
+    payload = {"texts": [123], "pii_config": {"email": {"mask": "[EMAIL]"}}}
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 422
+    assert "Expected `str`, got `int`" in r.json()["detail"]
+
+    r = await client.post("/mask-pii", content=b"{not json")
+    assert r.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_empty_config_400(client):
     payload = {"texts": ["foo"], "pii_config": {}}
-    r = client.post("/mask-pii", json=payload)
+    r = await client.post("/mask-pii", json=payload)
     assert r.status_code == 400
     assert r.json()["detail"] == "PII configuration cannot be empty"
 
 
-def test_mask_pii_empty_texts_400(client):
+@pytest.mark.asyncio
+async def test_mask_pii_empty_texts_400(client):
     payload = {"texts": [], "pii_config": {"email": {"mask": "[EMAIL]"}}}
-    r = client.post("/mask-pii", json=payload)
+    r = await client.post("/mask-pii", json=payload)
     assert r.status_code == 400
     assert r.json()["detail"] == "Input texts cannot be empty"
 
 
-def test_mask_pii_whitespace_text_400(client):
+@pytest.mark.asyncio
+async def test_mask_pii_whitespace_text_400(client):
     payload = {"texts": ["   "], "pii_config": {"email": {"mask": "[EMAIL]"}}}
-    r = client.post("/mask-pii", json=payload)
+    r = await client.post("/mask-pii", json=payload)
     assert r.status_code == 400
     assert (
         r.json()["detail"] == "Input texts cannot be empty strings or whitespace only"
     )
 
 
-def test_mask_pii_validationerror_branch(monkeypatch, client):
+@pytest.mark.asyncio
+async def test_mask_pii_validationerror_branch(monkeypatch, client):
     # Make the app catch its ValidationError branch deterministically
     class FakeValidationError(Exception):
         pass
@@ -98,24 +302,197 @@ def test_mask_pii_validationerror_branch(monkeypatch, client):
     )
 
     payload = {"texts": ["hello"], "pii_config": {"email": {"mask": "[EMAIL]"}}}
-    r = client.post("/mask-pii", json=payload)
+    r = await client.post("/mask-pii", json=payload)
     assert r.status_code == 400
     assert "Invalid PII configuration" in r.json()["detail"]
 
 
-def test_mask_pii_internal_error_500(monkeypatch, client, dummy_config_class):
+@pytest.mark.asyncio
+async def test_mask_pii_internal_error_500(monkeypatch, client, dummy_config_class):
     # create config ok
     monkeypatch.setattr(
         server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
     )
 
     # make extract_pii blow up -> generic 500 except path
-    def boom(*args, **kwargs):
+    async def boom(*args, **kwargs):
         raise RuntimeError("unexpected")
 
     monkeypatch.setattr(server_module, "extract_pii", boom)
 
     payload = {"texts": ["hello"], "pii_config": {"email": {"mask": "[EMAIL]"}}}
-    r = client.post("/mask-pii", json=payload)
+    r = await client.post("/mask-pii", json=payload)
     assert r.status_code == 500
     assert r.json()["detail"] == "Internal server error"
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_stream_success(monkeypatch, client, dummy_config_class):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+
+    async def fake_extract_pii(text, Config):
+        if "alice@" in text:
+            # Finish last so results arrive out of input order
+            await asyncio.sleep(0.01)
+            return [{"type": "email", "pii": "alice@example.com"}]
+        return []
+
+    def fake_mask_pii(text, detected, Config):
+        masked = text
+        for item in detected:
+            masked = masked.replace(item["pii"], "[EMAIL]")
+        return masked
+
+    monkeypatch.setattr(server_module, "extract_pii", fake_extract_pii)
+    monkeypatch.setattr(server_module, "mask_pii", fake_mask_pii)
+
+    payload = {
+        "texts": ["Hi alice@example.com", "No PII"],
+        "pii_config": {"email": {"mask": "[EMAIL]"}},
+    }
+
+    r = await client.post("/mask-pii/stream", json=payload)
+    assert r.status_code == 200
+    assert r.headers["content-type"] == "application/x-ndjson"
+
+    lines = [json.loads(line) for line in r.text.splitlines()]
+    assert [line["index"] for line in lines] == [1, 0]
+    assert lines[1] == {
+        "index": 0,
+        "original_text": "Hi alice@example.com",
+        "masked_text": "Hi [EMAIL]",
+        "detected_pii": [{"type": "email", "pii": "alice@example.com"}],
+    }
+    assert lines[0]["masked_text"] == "No PII"
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_stream_reports_failed_texts(
+    monkeypatch, client, dummy_config_class
+):
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", lambda cfg: dummy_config_class
+    )
+
+    async def boom(*args, **kwargs):
+        raise RuntimeError("unexpected")
+
+    monkeypatch.setattr(server_module, "extract_pii", boom)
+
+    payload = {"texts": ["hello"], "pii_config": {"email": {"mask": "[EMAIL]"}}}
+    r = await client.post("/mask-pii/stream", json=payload)
+    assert r.status_code == 200
+    assert json.loads(r.text) == {"index": 0, "error": "Internal server error"}
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_stream_empty_texts_400(client):
+    payload = {"texts": [], "pii_config": {"email": {"mask": "[EMAIL]"}}}
+    r = await client.post("/mask-pii/stream", json=payload)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Input texts cannot be empty"
+
+
+@pytest.mark.asyncio
+async def test_register_config_and_mask_by_id(monkeypatch, client):
+    async def fake_extract_pii(text, Config):
+        assert set(Config.model_fields) == {"email"}
+        return [{"type": "email", "pii": "alice@example.com"}]
+
+    monkeypatch.setattr(server_module, "extract_pii", fake_extract_pii)
+    monkeypatch.setattr(server_module, "registered_configs", {})
+
+    config = {"pii_config": {"email": {"mask": "[EMAIL]"}}}
+    r = await client.post("/configs", json=config)
+    assert r.status_code == 200
+    config_id = r.json()["config_id"]
+
+    # Registering the same configuration again returns the same ID
+    assert (await client.post("/configs", json=config)).json()["config_id"] == config_id
+
+    def fail_create_dynamic_pii_config(cfg):
+        raise AssertionError("registered config should be reused")
+
+    monkeypatch.setattr(
+        server_module, "create_dynamic_pii_config", fail_create_dynamic_pii_config
+    )
+
+    payload = {"texts": ["Hi alice@example.com"], "config_id": config_id}
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 200
+    assert r.json()["masked_texts"] == ["Hi [EMAIL]"]
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_unknown_config_id_400(client):
+    payload = {"texts": ["hello"], "config_id": "does-not-exist"}
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "Unknown PII configuration ID: does-not-exist"
+
+
+@pytest.mark.asyncio
+async def test_register_config_empty_400(client):
+    r = await client.post("/configs", json={"pii_config": {}})
+    assert r.status_code == 400
+    assert r.json()["detail"] == "PII configuration cannot be empty"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "pii_type, reason",
+    [
+        ("_secret", "must not start with an underscore"),
+        ("model_config", "is a reserved name"),
+        ("schema", "is a reserved name"),
+        ("phone number", "must be a valid identifier"),
+    ],
+)
+async def test_register_config_invalid_type_name_400(
+    monkeypatch, client, pii_type, reason
+):
+    monkeypatch.setattr(server_module, "registered_configs", {})
+
+    config = {"pii_config": {pii_type: {"mask": "[SECRET]"}}}
+    r = await client.post("/configs", json=config)
+    assert r.status_code == 400
+    assert r.json()["detail"] == f"PII type '{pii_type}' {reason}"
+    assert server_module.registered_configs == {}
+
+
+@pytest.mark.asyncio
+async def test_mask_pii_invalid_type_name_400(client):
+    payload = {"texts": ["hello"], "pii_config": {"_secret": {"mask": "[SECRET]"}}}
+    r = await client.post("/mask-pii", json=payload)
+    assert r.status_code == 400
+    assert r.json()["detail"] == "PII type '_secret' must not start with an underscore"
+
+
+@pytest.mark.asyncio
+async def test_lifespan_warms_up_and_closes_client(monkeypatch):
+    calls = []
+
+    class FakeModels:
+        async def list(self):
+            calls.append("list")
+            raise RuntimeError("provider unreachable")
+
+    class FakeClient:
+        models = FakeModels()
+
+        def with_options(self, **options):
+            calls.append(options)
+            return self
+
+        async def close(self):
+            calls.append("close")
+
+    monkeypatch.setattr(server_module.masking, "client", FakeClient())
+
+    # A failed warm-up must not prevent startup
+    warm_up_options = {"timeout": 5, "max_retries": 0}
+    async with server_module.lifespan(fastapi_app):
+        assert calls == [warm_up_options, "list"]
+    assert calls == [warm_up_options, "list", "close"]